@@ -0,0 +1,87 @@
+"""
+Benchmark agent-run throughput vs. shard count
+
+Each simulated run mirrors the CPU/IO mix of a real demo run without calling
+AgentAuth: awaits a fake upstream round trip, decodes and re-encodes a large
+JSON response, and serializes its logs.
+
+Usage:
+    python bench_shards.py                     # process shards 1,2,4,...
+    python bench_shards.py --mode thread --runs 400 --shards 1 2 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from shards import SHARD_MODES, ShardPool, run_routed
+
+# Stand-in for an upstream AgentAuth response
+UPSTREAM_BODY = json.dumps({
+    "success": True,
+    "token": "x" * 512,
+    "transactions": [
+        {"id": i, "item": "Cloud Credits", "amount": 20, "scope": ["cloud_purchase"]}
+        for i in range(2000)
+    ],
+})
+
+
+async def simulated_run(principal: str) -> int:
+    """One agent run: network wait + JSON decode/encode + log serialization"""
+    logs = []
+    for step in range(3):
+        await asyncio.sleep(0.005)  # upstream latency
+        data = json.loads(UPSTREAM_BODY)
+        logs.append({"agent": principal, "step": step, "count": len(data["transactions"])})
+        json.dumps(data)
+    return len(json.dumps(logs))
+
+
+async def measure(shards: int, mode: str, runs: int) -> float:
+    """Return runs/second for `runs` concurrent runs over `shards` shards"""
+    pool = ShardPool(shards, mode) if shards > 0 else None
+    try:
+        # Warm up every shard (process start-up, imports)
+        await asyncio.gather(*(
+            run_routed(pool, f"user_{i}", simulated_run, f"user_{i}") for i in range(shards * 4)
+        ))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_routed(pool, f"user_{i}", simulated_run, f"user_{i}") for i in range(runs)
+        ))
+        return runs / (time.perf_counter() - start)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_shards = [0] + [n for n in (1, 2, 4, 8, 16) if n <= cpus]
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=SHARD_MODES, default="process")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--shards", type=int, nargs="+", default=default_shards,
+                        help="shard counts to test (0 = inline on one loop)")
+    args = parser.parse_args()
+
+    print(f"mode={args.mode} runs={args.runs} cpus={cpus}")
+    print(f"{'shards':>6}  {'runs/s':>8}  {'speedup':>7}")
+    baseline = None
+    for shards in args.shards:
+        rate = asyncio.run(measure(shards, args.mode, args.runs))
+        baseline = baseline or rate
+        label = "inline" if shards == 0 else str(shards)
+        print(f"{label:>6}  {rate:8.1f}  {rate / baseline:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
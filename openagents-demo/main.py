@@ -5,6 +5,9 @@ This service:
 1. Runs an OpenAgents network with real agent-to-agent communication
 2. Exposes FastAPI endpoints for the Next.js app to trigger demos
 3. Agents communicate through OpenAgents and call AgentAuth API
+
+Set AGENT_SHARDS > 0 to spread agent runs over that many event-loop shards
+(see shards.py), routed by principal (or by token for analytics attempts).
 """
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
@@ -14,23 +17,35 @@ import os
 import asyncio
 from typing import Optional, List, Dict, Any
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 
 # OpenAgents imports
 from openagents.agents.worker_agent import WorkerAgent
 
+from shards import ShardError, ShardPool, run_routed
+
 # Configuration
 AGENTAUTH_API = os.getenv("AGENTAUTH_API", "https://your-app.zeabur.app")
 NETWORK_HOST = os.getenv("NETWORK_HOST", "localhost")
 NETWORK_PORT = int(os.getenv("NETWORK_PORT", 8700))
+AGENT_SHARDS = int(os.getenv("AGENT_SHARDS", 0))  # 0 = run on uvicorn's loop
+AGENT_SHARD_MODE = os.getenv("AGENT_SHARD_MODE", "process")  # process | thread
 
 # Store for demo results
 demo_results: Dict[str, Any] = {}
 agent_logs: List[Dict[str, Any]] = []
 
+# Logs of the run executing in the current task (runs may be concurrent/sharded)
+run_logs: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("run_logs", default=None)
+
+# Shard pool, created at startup when AGENT_SHARDS > 0
+agent_pool: Optional[ShardPool] = None
+
 
 def add_log(agent: str, message: str, log_type: str = "info"):
     """Add a log entry"""
-    agent_logs.append({
+    logs = run_logs.get()
+    (agent_logs if logs is None else logs).append({
         "agent": agent,
         "message": message,
         "type": log_type
@@ -51,14 +66,10 @@ class ShoppingAgent(WorkerAgent):
     default_agent_id = "agent_shopping"
     default_channels = ["#general"]
 
-    def __init__(self):
-        super().__init__()
-        self.token = None
-
     async def on_startup(self):
         add_log("agent_shopping", "Shopping Agent online!", "success")
 
-    async def authorize_and_purchase(self):
+    async def authorize_and_purchase(self, principal: str = "user_123"):
         """Run the shopping agent flow"""
         add_log("agent_shopping", "Requesting authorization from AgentAuth...", "info")
 
@@ -67,7 +78,7 @@ class ShoppingAgent(WorkerAgent):
             resp = await client.post(
                 f"{AGENTAUTH_API}/api/authorize",
                 json={
-                    "principal": "user_123",
+                    "principal": principal,
                     "agent": "agent_shopping",
                     "scope": ["cloud_purchase"],
                     "limit": 50,
@@ -78,7 +89,8 @@ class ShoppingAgent(WorkerAgent):
             data = resp.json()
 
             if data.get("success"):
-                self.token = data["token"]
+                # Local, not on self: concurrent runs share this agent instance
+                token = data["token"]
                 add_log("agent_shopping", "Authorization granted! Scope: cloud_purchase, Limit: $50", "success")
             else:
                 add_log("agent_shopping", f"Authorization failed: {data}", "error")
@@ -88,7 +100,7 @@ class ShoppingAgent(WorkerAgent):
             add_log("agent_shopping", "Attempting $20 purchase...", "info")
             resp = await client.post(
                 f"{AGENTAUTH_API}/api/purchase",
-                headers={"Authorization": f"Bearer {self.token}"},
+                headers={"Authorization": f"Bearer {token}"},
                 json={
                     "item": "Cloud Credits",
                     "amount": 20,
@@ -103,7 +115,7 @@ class ShoppingAgent(WorkerAgent):
             else:
                 add_log("agent_shopping", f"Purchase rejected: {result.get('reason')}", "error")
 
-            return self.token
+            return token
 
 
 class AnalyticsAgent(WorkerAgent):
@@ -150,42 +162,12 @@ analytics_agent = AnalyticsAgent()
 
 
 # ============================================================
-# FASTAPI APP
+# AGENT RUNS
 # ============================================================
+# Module-level so they can be shipped to shard processes. Each run collects
+# its own logs and returns them with the result.
 
-app = FastAPI(
-    title="AgentAuth + OpenAgents Demo",
-    description="Multi-agent security demonstration using OpenAgents framework",
-    version="1.0.0"
-)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-@app.get("/")
-async def root():
-    """API info"""
-    return {
-        "service": "AgentAuth + OpenAgents Demo",
-        "description": "Multi-agent security demonstration",
-        "agentauth_api": AGENTAUTH_API,
-        "endpoints": {
-            "run_demo": "GET /agents/demo/run",
-            "get_logs": "GET /agents/logs",
-            "clear_logs": "POST /agents/logs/clear",
-            "health": "GET /health"
-        }
-    }
-
-
-@app.get("/agents/demo/run")
-async def run_multi_agent_demo():
+async def execute_demo(principal: str) -> Dict[str, Any]:
     """
     Run the complete multi-agent security demo.
 
@@ -194,21 +176,21 @@ async def run_multi_agent_demo():
     2. Shopping Agent makes a purchase (should succeed)
     3. Analytics Agent tries to use Shopping's token (should fail)
     """
-    global agent_logs
-    agent_logs = []  # Clear previous logs
+    logs: List[Dict[str, Any]] = []
+    run_logs.set(logs)
 
     add_log("system", "Starting Multi-Agent Security Demo...", "info")
     add_log("system", f"Using AgentAuth API: {AGENTAUTH_API}", "info")
 
     try:
         # Step 1 & 2: Shopping Agent authorizes and purchases
-        token = await shopping_agent.authorize_and_purchase()
+        token = await shopping_agent.authorize_and_purchase(principal)
 
         if not token:
             return {
                 "success": False,
                 "security_test_passed": False,
-                "logs": agent_logs,
+                "logs": logs,
                 "conclusion": "Demo failed: Shopping Agent could not get authorization"
             }
 
@@ -230,7 +212,7 @@ async def run_multi_agent_demo():
         return {
             "success": True,
             "security_test_passed": security_working,
-            "logs": agent_logs,
+            "logs": logs,
             "conclusion": "Multi-agent security working! Token misuse was blocked." if security_working else "Security issue: Token was not properly bound to agent."
         }
 
@@ -239,11 +221,104 @@ async def run_multi_agent_demo():
         return {
             "success": False,
             "security_test_passed": False,
-            "logs": agent_logs,
+            "logs": logs,
             "error": str(e)
         }
 
 
+async def execute_shopping_authorize(principal: str) -> Dict[str, Any]:
+    """Shopping Agent authorization + purchase"""
+    logs: List[Dict[str, Any]] = []
+    run_logs.set(logs)
+
+    token = await shopping_agent.authorize_and_purchase(principal)
+    return {
+        "success": token is not None,
+        "token": token,
+        "logs": logs
+    }
+
+
+async def execute_analytics_attempt(token: str) -> Dict[str, Any]:
+    """Analytics Agent attempt with another agent's token"""
+    logs: List[Dict[str, Any]] = []
+    run_logs.set(logs)
+
+    blocked = await analytics_agent.attempt_with_stolen_token(token)
+    return {
+        "blocked": blocked,
+        "security_working": blocked,
+        "logs": logs
+    }
+
+
+# ============================================================
+# FASTAPI APP
+# ============================================================
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the agent shard pool"""
+    global agent_pool
+    if AGENT_SHARDS > 0:
+        agent_pool = ShardPool(AGENT_SHARDS, AGENT_SHARD_MODE)
+    try:
+        yield
+    finally:
+        if agent_pool is not None:
+            agent_pool.close()
+            agent_pool = None
+
+
+app = FastAPI(
+    title="AgentAuth + OpenAgents Demo",
+    description="Multi-agent security demonstration using OpenAgents framework",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+async def run_agent(key: str, fn, *args) -> Dict[str, Any]:
+    """Run an agent flow (on its shard when enabled); shard failures become 503s"""
+    try:
+        return await run_routed(agent_pool, key, fn, *args)
+    except ShardError as e:
+        raise HTTPException(status_code=503, detail=f"Agent shard unavailable: {str(e).splitlines()[0]}")
+
+
+@app.get("/")
+async def root():
+    """API info"""
+    return {
+        "service": "AgentAuth + OpenAgents Demo",
+        "description": "Multi-agent security demonstration",
+        "agentauth_api": AGENTAUTH_API,
+        "endpoints": {
+            "run_demo": "GET /agents/demo/run",
+            "get_logs": "GET /agents/logs",
+            "clear_logs": "POST /agents/logs/clear",
+            "health": "GET /health"
+        }
+    }
+
+
+@app.get("/agents/demo/run")
+async def run_multi_agent_demo(principal: str = "user_123"):
+    """Run the complete multi-agent security demo (see execute_demo)"""
+    global agent_logs
+    result = await run_agent(principal, execute_demo, principal)
+    agent_logs = result["logs"]
+    return result
+
+
 @app.get("/agents/logs")
 async def get_logs():
     """Get current agent logs"""
@@ -259,31 +334,21 @@ async def clear_logs():
 
 
 @app.get("/agents/shopping/authorize")
-async def shopping_authorize():
+async def shopping_authorize(principal: str = "user_123"):
     """Direct endpoint for Shopping Agent authorization"""
     global agent_logs
-    agent_logs = []
-
-    token = await shopping_agent.authorize_and_purchase()
-    return {
-        "success": token is not None,
-        "token": token,
-        "logs": agent_logs
-    }
+    result = await run_agent(principal, execute_shopping_authorize, principal)
+    agent_logs = result["logs"]
+    return result
 
 
 @app.get("/agents/analytics/attempt")
 async def analytics_attempt(token: str):
     """Direct endpoint for Analytics Agent to attempt using a token"""
     global agent_logs
-    agent_logs = []
-
-    blocked = await analytics_agent.attempt_with_stolen_token(token)
-    return {
-        "blocked": blocked,
-        "security_working": blocked,
-        "logs": agent_logs
-    }
+    result = await run_agent(token, execute_analytics_attempt, token)
+    agent_logs = result["logs"]
+    return result
 
 
 @app.get("/health")
@@ -303,6 +368,8 @@ async def config():
         "agentauth_api": AGENTAUTH_API,
         "network_host": NETWORK_HOST,
         "network_port": NETWORK_PORT,
+        "agent_shards": len(agent_pool) if agent_pool is not None else 0,
+        "agent_shard_mode": AGENT_SHARD_MODE if agent_pool is not None else None,
         "agents": ["agent_shopping", "agent_analytics"]
     }
 
@@ -0,0 +1,361 @@
+"""
+Sharded agent execution
+
+Runs agent work on several event loops instead of uvicorn's single loop, so
+CPU-bound parts of a run (JSON encode/decode of upstream responses, log
+serialization, token handling) can use more than one core.
+
+Each shard owns one event loop (uvloop when installed) living in either:
+- a worker process ("process" mode) - real multi-core scaling
+- a worker thread ("thread" mode) - cheaper, but shares the GIL
+
+Runs are routed to a shard by a stable hash of a key (principal or token),
+so all work for the same key lands on the same loop. Results come back to the
+caller as awaitables on the API's own event loop. A process shard that dies
+fails its pending runs with ShardError and is restarted on the next submit.
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import pickle
+import queue
+import threading
+import traceback
+import zlib
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+SHARD_MODES = ("process", "thread")
+
+
+class ShardError(RuntimeError):
+    """Raised on the API side when a shard cannot deliver a run's result"""
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """Create an event loop, preferring uvloop when it is available"""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+def shard_for(key: str, shard_count: int) -> int:
+    """Map a routing key to a shard index (stable across processes)"""
+    return zlib.crc32(key.encode("utf-8")) % shard_count
+
+
+def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None):
+    """Complete `future` unless the caller already cancelled it"""
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass  # cancelled between the check and the set
+
+
+# ============================================================
+# THREAD SHARDS
+# ============================================================
+
+class _ThreadShard:
+    """An event loop running forever in a daemon thread"""
+
+    def __init__(self, index: int):
+        self.loop = new_event_loop()
+        self.thread = threading.Thread(
+            target=self._run, name=f"agent-shard-{index}", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
+
+    def submit(self, fn: Callable[..., Awaitable[Any]], args: tuple) -> Future:
+        future: Future = Future()
+
+        def resolve(task: asyncio.Task):
+            if task.cancelled():
+                _settle(future, error=ShardError("Shard closed before run completed"))
+            elif task.exception() is not None:
+                _settle(future, error=task.exception())
+            else:
+                _settle(future, task.result())
+
+        def forward_cancel(task: asyncio.Task):
+            # A cancelled request stops its run on the shard loop
+            if future.cancelled() and not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(task.cancel)
+
+        def start():
+            if future.cancelled():
+                return
+            try:
+                task = self.loop.create_task(fn(*args))
+            except Exception as e:
+                _settle(future, error=e)
+            else:
+                task.add_done_callback(resolve)
+                future.add_done_callback(lambda _: forward_cancel(task))
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+    def close(self, timeout: float):
+        async def cancel_runs():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Cancelled runs fail their futures with ShardError (see resolve)
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_runs(), self.loop).result(timeout)
+        except FutureTimeoutError:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+
+
+# ============================================================
+# PROCESS SHARDS
+# ============================================================
+# Jobs and results cross the process boundary as bytes pickled by us, not by
+# the queue's feeder thread, so pickling errors reach the caller instead of
+# being printed and dropped.
+
+def _describe(e: BaseException) -> str:
+    return f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+
+
+def _process_shard_main(requests, responses):
+    """Entry point of a shard process: run jobs from `requests` concurrently"""
+    loop = new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    tasks: Dict[int, asyncio.Task] = {}
+
+    async def run_job(job_id, job):
+        try:
+            fn, args = pickle.loads(job)
+            payload = pickle.dumps(await fn(*args))
+        except Exception as e:
+            responses.put((job_id, False, _describe(e)))
+        else:
+            responses.put((job_id, True, payload))
+        finally:
+            tasks.pop(job_id, None)
+
+    def start(job_id, job):
+        if job is None:
+            # (job_id, None): the caller cancelled this run
+            task = tasks.pop(job_id, None)
+            if task is not None:
+                task.cancel()
+            return
+        tasks[job_id] = loop.create_task(run_job(job_id, job))
+
+    def reader():
+        # Blocking queue reads happen off-loop; jobs are handed to the loop
+        while True:
+            item = requests.get()
+            if item is None:
+                loop.call_soon_threadsafe(loop.stop)
+                return
+            loop.call_soon_threadsafe(start, *item)
+
+    threading.Thread(target=reader, daemon=True).start()
+    try:
+        loop.run_forever()
+    finally:
+        # Runs still in flight are abandoned; the parent fails their futures
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+
+class _ProcessShard:
+    """An event loop in a separate process, fed through multiprocessing queues"""
+
+    # How often the collector checks that the shard process is still running
+    poll_interval = 0.2
+
+    def __init__(self, index: int, ctx):
+        self.index = index
+        self.requests = ctx.Queue()
+        self.responses = ctx.Queue()
+        self.pending: Dict[int, Future] = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.dead = False
+
+        self.process = ctx.Process(
+            target=_process_shard_main,
+            args=(self.requests, self.responses),
+            name=f"agent-shard-{index}",
+            daemon=True,
+        )
+        self.process.start()
+
+        self.collector = threading.Thread(
+            target=self._collect, name=f"agent-shard-{index}-results", daemon=True
+        )
+        self.collector.start()
+
+    def _resolve(self, item):
+        job_id, ok, payload = item
+        with self.lock:
+            future = self.pending.pop(job_id, None)
+        if future is None:
+            return
+        if not ok:
+            _settle(future, error=ShardError(payload))
+            return
+        try:
+            result = pickle.loads(payload)
+        except Exception as e:
+            _settle(future, error=ShardError(f"Could not unpickle result: {_describe(e)}"))
+        else:
+            _settle(future, result)
+
+    def _collect(self):
+        """Resolve pending futures as results arrive, until the process exits"""
+        while True:
+            try:
+                self._resolve(self.responses.get(timeout=self.poll_interval))
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+            except Exception:
+                # Never let one bad result stop delivery for the whole shard
+                traceback.print_exc()
+
+        # Results flushed just before exit may still be in the pipe
+        while True:
+            try:
+                self._resolve(self.responses.get(timeout=self.poll_interval))
+            except queue.Empty:
+                break
+            except Exception:
+                traceback.print_exc()
+
+        # Shard is gone: fail anything still waiting on it, and refuse new runs
+        with self.lock:
+            self.dead = True
+            leftovers, self.pending = self.pending, {}
+        reason = f"Shard {self.index} exited (code {self.process.exitcode}) before run completed"
+        for future in leftovers.values():
+            _settle(future, error=ShardError(reason))
+
+    def is_alive(self) -> bool:
+        return not self.dead
+
+    def submit(self, fn: Callable[..., Awaitable[Any]], args: tuple) -> Future:
+        job = pickle.dumps((fn, args))  # raises here, in the caller, if unpicklable
+        future: Future = Future()
+        job_id = next(self.ids)
+        with self.lock:
+            if self.dead:
+                raise ShardError(f"Shard {self.index} is not running")
+            self.pending[job_id] = future
+        future.add_done_callback(lambda f: f.cancelled() and self._cancel(job_id))
+        self.requests.put((job_id, job))
+        return future
+
+    def _cancel(self, job_id: int):
+        """Forget a run the caller cancelled and stop it in the shard"""
+        with self.lock:
+            if self.pending.pop(job_id, None) is None or self.dead:
+                return
+        self.requests.put((job_id, None))
+
+    def close(self, timeout: float):
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.collector.join()
+
+
+# ============================================================
+# POOL
+# ============================================================
+
+class ShardPool:
+    """
+    A fixed set of event-loop shards.
+
+    In "process" mode, `fn` and its arguments are pickled, so `fn` must be a
+    module-level async function and the arguments/result plain data.
+    """
+
+    def __init__(self, shards: int, mode: str = "process"):
+        if shards < 1:
+            raise ValueError("shards must be >= 1")
+        if mode not in SHARD_MODES:
+            raise ValueError(f"mode must be one of {SHARD_MODES}, got {mode!r}")
+
+        self.mode = mode
+        # spawn: never fork a parent that already runs threads and a loop
+        self._ctx = multiprocessing.get_context("spawn")
+        self._shards: List[Any] = [self._new_shard(i) for i in range(shards)]
+
+    def _new_shard(self, index: int):
+        if self.mode == "thread":
+            return _ThreadShard(index)
+        return _ProcessShard(index, self._ctx)
+
+    def __len__(self) -> int:
+        return len(self._shards)
+
+    def submit(self, key: str, fn: Callable[..., Awaitable[Any]], *args) -> Future:
+        """Schedule `fn(*args)` on the shard owning `key`"""
+        if not self._shards:
+            raise ShardError("Shard pool is closed")
+
+        index = shard_for(key, len(self._shards))
+        shard = self._shards[index]
+        if not shard.is_alive():
+            # Replace a crashed shard; its pending runs were already failed
+            shard.close(timeout=0)
+            shard = self._shards[index] = self._new_shard(index)
+        return shard.submit(fn, args)
+
+    async def run(self, key: str, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Run `fn(*args)` on the shard owning `key` and await its result"""
+        return await asyncio.wrap_future(self.submit(key, fn, *args))
+
+    def close(self, timeout: float = 5.0):
+        """
+        Stop every shard, waiting up to `timeout` seconds for each to exit.
+        Runs still pending fail with ShardError; stuck shard processes are
+        terminated.
+        """
+        shards, self._shards = self._shards, []
+        for shard in shards:
+            shard.close(timeout)
+
+
+async def run_routed(
+    pool: Optional[ShardPool], key: str, fn: Callable[..., Awaitable[Any]], *args
+) -> Any:
+    """Run on `pool` when sharding is enabled, otherwise inline on this loop"""
+    if pool is None:
+        return await fn(*args)
+    return await pool.run(key, fn, *args)
@@ -0,0 +1,291 @@
+"""
+Checks for the sharded execution pool (shards.py)
+
+Covers routing, thread/process round trips and the failure paths: errors
+raised by a run, unpicklable arguments/results, a shard process dying
+mid-run, callers cancelling or timing out a run, and closing the pool with
+runs still pending.
+
+Run directly or with pytest:
+    python test_shards.py
+    pytest test_shards.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from shards import SHARD_MODES, ShardError, ShardPool, run_routed, shard_for
+
+
+# Jobs live at module level so process shards can unpickle them
+
+async def echo(value):
+    return {"value": value, "pid": os.getpid()}
+
+
+async def fail(message):
+    raise ValueError(message)
+
+
+async def sleep_forever():
+    await asyncio.sleep(3600)
+
+
+async def block(value):
+    time.sleep(0.5)  # blocks the shard loop, so the result lands after a cancel
+    return value
+
+
+THREAD_RUN_STOPPED = threading.Event()
+
+
+async def sleep_until_cancelled():
+    try:
+        await asyncio.sleep(3600)
+    finally:
+        THREAD_RUN_STOPPED.set()
+
+
+async def crash():
+    os._exit(1)
+
+
+async def return_lock():
+    return threading.Lock()
+
+
+async def with_timeout(awaitable, seconds: float = 30.0):
+    return await asyncio.wait_for(awaitable, seconds)
+
+
+# ============================================================
+# ROUTING
+# ============================================================
+
+def test_shard_for_is_stable():
+    keys = [f"user_{i}" for i in range(100)]
+    first = [shard_for(key, 4) for key in keys]
+    assert first == [shard_for(key, 4) for key in keys]
+    assert all(0 <= index < 4 for index in first)
+    assert len(set(first)) == 4  # 100 keys spread over every shard
+
+
+def test_run_routed_inline_without_pool():
+    result = asyncio.run(run_routed(None, "user_1", echo, 7))
+    assert result == {"value": 7, "pid": os.getpid()}
+
+
+# ============================================================
+# BOTH MODES
+# ============================================================
+
+def check_round_trip(mode: str):
+    async def scenario():
+        pool = ShardPool(2, mode)
+        try:
+            results = await with_timeout(asyncio.gather(
+                *(pool.run(f"user_{i}", echo, i) for i in range(10))
+            ))
+            assert [r["value"] for r in results] == list(range(10))
+
+            # Same key, same shard
+            pids = {(await pool.run("user_1", echo, 0))["pid"] for _ in range(3)}
+            assert len(pids) == 1
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
+
+
+def check_run_error(mode: str):
+    async def scenario():
+        pool = ShardPool(1, mode)
+        try:
+            await with_timeout(pool.run("user_1", fail, "bad input"))
+        except (ShardError, ValueError) as e:
+            assert "bad input" in str(e)
+            # Process shards can't ship the original exception back
+            assert isinstance(e, ShardError if mode == "process" else ValueError)
+        else:
+            raise AssertionError("expected the run to fail")
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
+
+
+def check_close_fails_pending(mode: str):
+    async def scenario():
+        pool = ShardPool(1, mode)
+        future = pool.submit("user_1", sleep_forever)
+        await asyncio.sleep(0.5)  # let the run start
+        pool.close(timeout=5)
+        try:
+            await with_timeout(asyncio.wrap_future(future))
+        except ShardError:
+            pass
+        else:
+            raise AssertionError("expected pending run to fail on close")
+
+        try:
+            pool.submit("user_1", echo, 1)
+        except ShardError:
+            pass
+        else:
+            raise AssertionError("expected submit to a closed pool to fail")
+
+    asyncio.run(scenario())
+
+
+def check_cancelled_run(mode: str):
+    async def scenario():
+        pool = ShardPool(1, mode)
+        try:
+            for job in (sleep_forever, block):
+                try:
+                    args = (1,) if job is block else ()
+                    await asyncio.wait_for(pool.run("user_1", job, *args), 0.1)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    raise AssertionError("expected the run to time out")
+
+            await asyncio.sleep(1)  # the late `block` result arrives meanwhile
+
+            # The shard still serves the same key
+            assert (await with_timeout(pool.run("user_1", echo, 2)))["value"] == 2
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_thread_round_trip():
+    check_round_trip("thread")
+
+
+def test_process_round_trip():
+    check_round_trip("process")
+
+
+def test_thread_run_error():
+    check_run_error("thread")
+
+
+def test_process_run_error():
+    check_run_error("process")
+
+
+def test_thread_cancelled_run():
+    check_cancelled_run("thread")
+
+
+def test_process_cancelled_run():
+    check_cancelled_run("process")
+
+
+def test_thread_cancel_stops_run():
+    async def scenario():
+        THREAD_RUN_STOPPED.clear()
+        pool = ShardPool(1, "thread")
+        try:
+            try:
+                await asyncio.wait_for(pool.run("user_1", sleep_until_cancelled), 0.2)
+            except asyncio.TimeoutError:
+                pass
+            assert await asyncio.to_thread(THREAD_RUN_STOPPED.wait, 5)
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_thread_close_fails_pending():
+    check_close_fails_pending("thread")
+
+
+def test_process_close_fails_pending():
+    check_close_fails_pending("process")
+
+
+# ============================================================
+# PROCESS-ONLY FAILURES
+# ============================================================
+
+def test_process_crash_fails_pending_and_restarts():
+    async def scenario():
+        pool = ShardPool(1, "process")
+        try:
+            pending = pool.submit("user_1", sleep_forever)
+            try:
+                await with_timeout(pool.run("user_1", crash))
+            except ShardError:
+                pass
+            else:
+                raise AssertionError("expected crashed run to fail")
+
+            try:
+                await with_timeout(asyncio.wrap_future(pending))
+            except ShardError as e:
+                assert "exited" in str(e)
+            else:
+                raise AssertionError("expected pending run on crashed shard to fail")
+
+            # Same key is served again by a replacement shard
+            assert (await with_timeout(pool.run("user_1", echo, 1)))["value"] == 1
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_process_unpicklable_result():
+    async def scenario():
+        pool = ShardPool(1, "process")
+        try:
+            await with_timeout(pool.run("user_1", return_lock))
+        except ShardError as e:
+            assert "pickle" in str(e)
+        else:
+            raise AssertionError("expected unpicklable result to fail")
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_process_unpicklable_argument():
+    async def scenario():
+        pool = ShardPool(1, "process")
+        try:
+            try:
+                pool.submit("user_1", echo, threading.Lock())
+            except TypeError:
+                pass
+            else:
+                raise AssertionError("expected unpicklable argument to fail in submit")
+
+            # The shard is unaffected
+            assert (await with_timeout(pool.run("user_1", echo, 2)))["value"] == 2
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
+
+
+def main():
+    tests = [(name, fn) for name, fn in globals().items() if name.startswith("test_")]
+    print(f"Running {len(tests)} shard checks (modes: {', '.join(SHARD_MODES)})")
+    for name, fn in tests:
+        fn()
+        print(f"  ok  {name}")
+    print("All shard checks passed")
+
+
+if __name__ == "__main__":
+    main()